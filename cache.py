@@ -0,0 +1,129 @@
+"""
+Response Cache Helpers
+
+Redis-backed cache for rendered product list responses. Lookups go through an
+exact key first, then a near-duplicate search query match using trigram sketches.
+Every helper degrades to a cache miss when Redis is not configured or unreachable.
+"""
+
+import hashlib
+import os
+import time
+from typing import Optional
+
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PRODUCTS_TTL = 60
+SIMILARITY_THRESHOLD = 0.8
+# Bounds the similarity scan: only the most recent queries per filter set are kept
+MAX_QUERIES_PER_FILTER = 256
+# After a Redis error every helper reports a miss for this long instead of paying the timeout again
+FAILURE_BACKOFF = 30.0
+
+_redis = None
+_down_until = 0.0
+
+redis_url = os.getenv("REDIS_URL")
+
+if redis_url:
+    _redis = redis.from_url(redis_url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+
+def _available() -> bool:
+    return _redis is not None and time.monotonic() >= _down_until
+
+
+def _trip():
+    global _down_until
+    _down_until = time.monotonic() + FAILURE_BACKOFF
+
+
+def query_sketch(q: str) -> frozenset:
+    """Lowercase character trigrams of a search query"""
+    text = " ".join(q.lower().split())
+    if len(text) < 3:
+        return frozenset((text,))
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def closest_query(q: str, candidates) -> Optional[str]:
+    """The candidate most similar to q, if any reaches SIMILARITY_THRESHOLD"""
+    sketch = query_sketch(q)
+    best, best_score = None, SIMILARITY_THRESHOLD
+    for candidate in candidates:
+        score = _jaccard(sketch, query_sketch(candidate))
+        if score >= best_score:
+            best, best_score = candidate, score
+    return best
+
+
+def _products_key(q: str, category: str, featured: Optional[bool], limit: int) -> str:
+    raw = repr((q, category, featured, limit)).encode()
+    return f"products:{hashlib.sha1(raw).hexdigest()}"
+
+
+def _queries_key(category: str, featured: Optional[bool], limit: int) -> str:
+    # Queries sharing the same filters are the candidates for a near-duplicate hit
+    return f"products:queries:{category}:{featured}:{limit}"
+
+
+async def get_cached_products(q: str, category: str, featured: Optional[bool], limit: int) -> Optional[bytes]:
+    """Return a rendered product list for an exact or near-duplicate query"""
+    if not _available():
+        return None
+    try:
+        # Exact body and live candidate queries in one round-trip; expired members are skipped by score
+        async with _redis.pipeline(transaction=False) as pipe:
+            pipe.get(_products_key(q, category, featured, limit))
+            if q:
+                pipe.zrangebyscore(_queries_key(category, featured, limit), time.time(), "+inf")
+            replies = await pipe.execute()
+        body = replies[0]
+        if body is not None or not q:
+            return body
+
+        best = closest_query(q, (member.decode() for member in replies[1]))
+        if best is None or best == q:
+            return None
+        return await _redis.get(_products_key(best, category, featured, limit))
+    except Exception:
+        _trip()
+        return None
+
+
+async def set_cached_products(q: str, category: str, featured: Optional[bool], limit: int, body: bytes):
+    """Store a rendered product list and register its query for similarity lookups"""
+    if not _available():
+        return
+    try:
+        async with _redis.pipeline(transaction=False) as pipe:
+            pipe.set(_products_key(q, category, featured, limit), body, ex=PRODUCTS_TTL)
+            if q:
+                queries_key = _queries_key(category, featured, limit)
+                pipe.zadd(queries_key, {q: time.time() + PRODUCTS_TTL})
+                pipe.zremrangebyrank(queries_key, 0, -(MAX_QUERIES_PER_FILTER + 1))
+                pipe.expire(queries_key, PRODUCTS_TTL)
+            await pipe.execute()
+    except Exception:
+        _trip()
+
+
+async def invalidate_cached_products():
+    """Drop every cached product list"""
+    if not _available():
+        return
+    try:
+        keys = [key async for key in _redis.scan_iter(match="products:*")]
+        if keys:
+            await _redis.delete(*keys)
+    except Exception:
+        _trip()
@@ -1,32 +1,60 @@
 import os
-from typing import List, Optional
+import re
+import time
+import asyncio
+import logging
+import secrets
+from types import MappingProxyType
+from functools import lru_cache
+from typing import List, Literal, Optional
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from datetime import datetime
-from bson import ObjectId
-
-from database import db, create_document, get_documents
-from schemas import Product as ProductSchema, Order as OrderSchema, Testimonial as TestimonialSchema, ContactMessage as ContactSchema
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, EmailStr
+from datetime import datetime, timezone
+import orjson
+from bson.regex import Regex
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, OperationFailure
+from cachetools import TTLCache
+from starlette.background import BackgroundTask
+
+from database import db, products, orders, testimonials, create_document, create_documents
+from cache import get_cached_products, set_cached_products, invalidate_cached_products
+from schemas import Product as ProductSchema, Testimonial as TestimonialSchema, ContactMessage as ContactSchema
+
+logger = logging.getLogger(__name__)
+
+app = FastAPI(
+    title="Nasir Store API",
+    description="E-commerce API for selling premium app accounts",
+    default_response_class=ORJSONResponse,
+)
 
-app = FastAPI(title="Nasir Store API", description="E-commerce API for selling premium app accounts")
+# Comma-separated list, e.g. "https://nasirstore.example,http://localhost:3000"
+ALLOWED_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "*").split(",") if o.strip()]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "authorization"],
 )
 
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Nasir Store Backend Running"}
 
 
+# Health checks get polled often; collection names are refreshed at most every 30s
+_COLLECTIONS_TTL = 30.0
+_collections_cache = {"ts": 0.0, "names": []}
+
+
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -42,7 +70,11 @@ def test_database():
             response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
             response["database_name"] = db.name if hasattr(db, "name") else ("✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set")
             try:
-                response["collections"] = db.list_collection_names()
+                now = time.monotonic()
+                if now - _collections_cache["ts"] > _COLLECTIONS_TTL:
+                    _collections_cache["names"] = await db.list_collection_names()
+                    _collections_cache["ts"] = now
+                response["collections"] = _collections_cache["names"]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
                 response["database"] = f"⚠️ Connected but error: {str(e)[:100]}"
@@ -60,46 +92,277 @@ def to_dict(doc):
     return doc
 
 
+async def stream_json_array(docs, collected: Optional[list] = None):
+    """Encode an async stream of documents as a JSON array, one document per chunk"""
+    # Hot per-document loop: bind lookups locally and convert _id in place
+    dumps = orjson.dumps
+    append = collected.append if collected is not None else None
+    yield b"["
+    first = True
+    async for d in docs:
+        d["_id"] = str(d["_id"])
+        if append is not None:
+            append(d)
+        chunk = dumps(d, default=str)
+        yield chunk if first else b"," + chunk
+        first = False
+    yield b"]"
+
+
+def text_trigrams(*parts: Optional[str]) -> List[str]:
+    """All lowercase length-3 windows of the given text fields"""
+    text = " ".join(p for p in parts if p).lower()
+    return sorted({text[i:i + 3] for i in range(len(text) - 2)})
+
+
+# Internal search columns that never leave the API
+SEARCH_FIELDS_EXCLUDED = {"trigrams": 0, "name_lc": 0}
+
+
+# Fields a product card needs; list responses skip the long description
+PRODUCT_CARD_FIELDS = {
+    "name": 1,
+    "slug": 1,
+    "short_description": 1,
+    "logo_url": 1,
+    "category": 1,
+    "price_monthly": 1,
+    "price_lifetime": 1,
+    "is_featured": 1,
+    "durations": 1,
+    "login_method": 1,
+}
+
+
+@lru_cache(maxsize=1024)
+def _prefix_pattern(q: str) -> Regex:
+    return Regex(f"^{re.escape(q.lower())}")
+
+
+def search_fields(name: Optional[str], description: Optional[str], short_description: Optional[str]) -> dict:
+    """Derived columns that back the fallback product search"""
+    return {
+        "name_lc": (name or "").lower(),
+        "trigrams": text_trigrams(name, description, short_description),
+    }
+
+
+def with_search_fields(product: ProductSchema) -> dict:
+    # JSON mode turns HttpUrl into str, which BSON can encode
+    data = product.model_dump(mode="json", exclude_none=True)
+    data.update(search_fields(product.name, product.description, product.short_description))
+    return data
+
+
+async def backfill_search_fields() -> int:
+    """Add search columns to products written before they existed"""
+    updates = []
+    async for d in products.find(
+        {"$or": [{"trigrams": {"$exists": False}}, {"name_lc": {"$exists": False}}]},
+        {"name": 1, "description": 1, "short_description": 1}
+    ):
+        fields = search_fields(d.get("name"), d.get("description"), d.get("short_description"))
+        updates.append(UpdateOne({"_id": d["_id"]}, {"$set": fields}))
+    if updates:
+        await products.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+# -------------------- Startup --------------------
+
+# Set when a $text query reports the index missing; $text is retried once the back-off elapses
+_TEXT_INDEX_RETRY = 60.0
+_INDEX_NOT_FOUND = 27
+_text_index_missing_at: Optional[float] = None
+
+
+def _text_search_available() -> bool:
+    return _text_index_missing_at is None or time.monotonic() - _text_index_missing_at > _TEXT_INDEX_RETRY
+
+
+def _mark_text_index_missing():
+    global _text_index_missing_at
+    _text_index_missing_at = time.monotonic()
+
+# (collection, keys, create_index options) built at startup
+_INDEXES = [
+    ("product", "trigrams", {}),
+    ("product", "name_lc", {}),
+    ("product", "slug", {"unique": True}),
+    ("product", [("is_active", 1), ("category", 1), ("is_featured", 1)], {}),
+    ("order", "order_code", {"unique": True}),
+    ("testimonial", [("created_at", -1)], {}),
+]
+
+
+@app.on_event("startup")
+async def ensure_indexes():
+    _collections_cache["ts"] = 0.0
+    if db is None:
+        return
+    try:
+        await products.create_index(
+            [("name", "text"), ("description", "text"), ("short_description", "text")],
+            name="product_text_search",
+        )
+    except ConnectionFailure as e:
+        # Every other index build would wait out the same server selection timeout
+        logger.warning("Skipping index builds, database unreachable: %s", e)
+        return
+    except Exception as e:
+        logger.warning("Could not build product text index: %s", e)
+    for collection_name, keys, options in _INDEXES:
+        try:
+            await db[collection_name].create_index(keys, **options)
+        except Exception as e:
+            # An index that cannot be built (e.g. duplicate slugs) must not block startup
+            logger.warning("Could not build index %s on %s: %s", keys, collection_name, e)
+    try:
+        backfilled = await backfill_search_fields()
+        if backfilled:
+            logger.info("Backfilled search fields on %d products", backfilled)
+    except Exception as e:
+        logger.warning("Could not backfill product search fields: %s", e)
+
+
 # -------------------- Products --------------------
 
 class ProductCreate(ProductSchema):
     pass
 
+
+# Catalog changes rarely, so identical filter tuples are served from memory
+_products_cache: TTLCache = TTLCache(maxsize=512, ttl=60)
+_products_cache_lock = asyncio.Lock()
+
+
+async def invalidate_products_cache():
+    _products_cache.clear()
+    await invalidate_cached_products()
+
+
 @app.get("/api/products")
-def list_products(
+async def list_products(
     q: Optional[str] = Query(None, description="Search query"),
     category: Optional[str] = Query(None),
     featured: Optional[bool] = Query(None),
     limit: int = Query(100, ge=1, le=200),
 ):
+    cache_key = (q or "", category or "", featured, limit)
+    async with _products_cache_lock:
+        cached = _products_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    # Shared Redis tier: exact filters first, then a near-duplicate search query
+    body = await get_cached_products(*cache_key)
+    if body is not None:
+        return Response(content=body, media_type="application/json")
+
     filt = {"is_active": True}
     if category:
         filt["category"] = category
     if featured is not None:
         filt["is_featured"] = featured
+    docs = None
+    if q and _text_search_available():
+        # Ranked lookup served by the text index; sorting on the score does not need it projected
+        cursor = products.find({**filt, "$text": {"$search": q}}, PRODUCT_CARD_FIELDS).sort(
+            [("score", {"$meta": "textScore"})]
+        ).limit(limit)
+        try:
+            # None when whole-word search found nothing; fall back to infix/prefix matching below
+            docs = await _peek(cursor)
+        except OperationFailure as e:
+            if e.code != _INDEX_NOT_FOUND:
+                raise
+            logger.warning("Product text index missing, falling back to substring search")
+            _mark_text_index_missing()
+    if docs is None:
+        docs = await _peek(_fallback_search(filt, q, limit)) or _empty()
+
+    async def _body():
+        nonlocal complete
+        result = []
+        async for chunk in stream_json_array(docs, collected=result):
+            chunks.append(chunk)
+            yield chunk
+        complete = True
+        async with _products_cache_lock:
+            _products_cache[cache_key] = result
+
+    async def _store():
+        # Runs after the response is sent, so a slow Redis never delays the client.
+        # A disconnect cancels the stream but still runs this; never cache a truncated body.
+        if complete:
+            await set_cached_products(*cache_key, b"".join(chunks))
+
+    chunks = []
+    complete = False
+    return StreamingResponse(_body(), media_type="application/json", background=BackgroundTask(_store))
+
+
+def _fallback_search(filt: dict, q: Optional[str], limit: int):
+    """Product lookup used when there is no query, $text found nothing, or the text index is unavailable"""
+    if q and len(q) >= 3:
+        # Prefilter candidates by trigram equality on the index, then confirm the substring here
+        filt = {**filt, "trigrams": {"$all": text_trigrams(q)}}
+        return _confirm_substring(products.find(filt, {**PRODUCT_CARD_FIELDS, "description": 1}), q, limit)
     if q:
-        # Basic search across fields
-        filt["$or"] = [
-            {"name": {"$regex": q, "$options": "i"}},
-            {"description": {"$regex": q, "$options": "i"}},
-            {"short_description": {"$regex": q, "$options": "i"}},
-        ]
-    docs = db["product"].find(filt).limit(limit)
-    return [to_dict(d) for d in docs]
+        # Too short for trigrams; match it as a name prefix instead
+        return _prefix_search(filt, q, limit)
+    return products.find(filt, PRODUCT_CARD_FIELDS).limit(limit)
+
+
+def _prefix_search(filt: dict, q: str, limit: int):
+    # Anchored and case-sensitive on its own so it is served from the name_lc index
+    return products.find({**filt, "name_lc": _prefix_pattern(q)}, PRODUCT_CARD_FIELDS).limit(limit)
+
+
+async def _empty():
+    return
+    yield
+
+
+async def _peek(cursor):
+    """Fetch the first document so query errors surface before streaming starts; None if empty"""
+    it = cursor.__aiter__()
+    try:
+        first = await it.__anext__()
+    except StopAsyncIteration:
+        return None
+    return _chain(first, it)
+
+
+async def _chain(first, rest):
+    yield first
+    async for d in rest:
+        yield d
+
+
+async def _confirm_substring(cursor, q: str, limit: int):
+    pattern = re.compile(re.escape(q), re.IGNORECASE)
+    found = 0
+    async for d in cursor:
+        description = d.pop("description", None)
+        if any(pattern.search(text or "") for text in (d.get("name"), description, d.get("short_description"))):
+            yield d
+            found += 1
+            if found >= limit:
+                return
 
 
 @app.get("/api/products/{slug}")
-def get_product(slug: str):
-    doc = db["product"].find_one({"slug": slug, "is_active": True})
+async def get_product(slug: str):
+    doc = await products.find_one({"slug": slug, "is_active": True}, SEARCH_FIELDS_EXCLUDED)
     if not doc:
         raise HTTPException(status_code=404, detail="Product not found")
     return to_dict(doc)
 
 
 @app.post("/api/seed")
-def seed_products():
+async def seed_products():
     # Seed only if empty
-    count = db["product"].count_documents({})
+    count = await products.count_documents({})
     if count > 0:
         return {"seeded": False, "message": "Products already exist"}
     samples: List[ProductCreate] = [
@@ -171,81 +434,104 @@ def seed_products():
             is_active=True,
         ),
     ]
-    for p in samples:
-        create_document("product", p)
-    return {"seeded": True, "count": len(samples)}
+    inserted_ids = await create_documents("product", [with_search_fields(p) for p in samples])
+    await invalidate_products_cache()
+    return {"seeded": True, "count": len(inserted_ids)}
 
 
 # -------------------- Orders & Payments --------------------
 
+# Validated once here; the order document is written without a second schema pass
 class OrderCreate(BaseModel):
     product_slug: str
     package: str
     buyer_name: str
-    email: str
+    email: EmailStr
     whatsapp: str
-    payment_method: str  # "QRIS" | "Bank Transfer" | "E-Wallet"
-    delivery_channel: str = "email"  # email | whatsapp | both
+    payment_method: Literal["QRIS", "Bank Transfer", "E-Wallet"]
+    delivery_channel: Literal["email", "whatsapp", "both"] = "email"
+
+
+PACKAGE_MULTIPLIER = MappingProxyType({
+    "1 Month": 1,
+    "3 Months": 3,
+    "6 Months": 6,
+    "12 Months": 12,
+    "Lifetime": 20,  # arbitrary demo multiplier
+})
+
+_ORDER_CODE_FORMAT = "NS-%Y%m%d%H%M%S"
+_ORDER_CODE_ATTEMPTS = 3
+
+_PAYMENT_INSTRUCTIONS = MappingProxyType({
+    "QRIS": MappingProxyType({
+        "type": "qris",
+        "note": "Scan QR berikut di aplikasi e-wallet Anda",
+        "qr_image": "https://api.qrserver.com/v1/create-qr-code/?size=220x220&data=NASIR-STORE-DEMO",
+    }),
+    "Bank Transfer": MappingProxyType({
+        "type": "bank",
+        "bank": "BCA",
+        "account_name": "NASIR STORE",
+        "account_number": "1234567890",
+    }),
+    "E-Wallet": MappingProxyType({
+        "type": "ewallet",
+        "provider": "OVO/DANA/GoPay",
+        "number": "0812-3456-7890",
+        "name": "NASIR STORE",
+    }),
+})
 
 
 def generate_order_code() -> str:
-    return f"NS-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
+    # Millisecond timestamp plus a random suffix, e.g. NS-20261015173233123-9F2C
+    now = time.time()
+    stamp = time.strftime(_ORDER_CODE_FORMAT, time.gmtime(now))
+    return f"{stamp}{int(now * 1000) % 1000:03d}-{secrets.token_hex(2).upper()}"
 
 
 @app.post("/api/orders")
-def create_order(payload: OrderCreate):
-    product = db["product"].find_one({"slug": payload.product_slug})
+async def create_order(payload: OrderCreate):
+    product = await products.find_one({"slug": payload.product_slug}, {"price_monthly": 1, "name": 1})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     # Determine price from package
     base = product.get("price_monthly", 0)
-    multiplier = {
-        "1 Month": 1,
-        "3 Months": 3,
-        "6 Months": 6,
-        "12 Months": 12,
-        "Lifetime": 20,  # arbitrary demo multiplier
-    }.get(payload.package)
+    multiplier = PACKAGE_MULTIPLIER.get(payload.package)
     if multiplier is None:
         raise HTTPException(status_code=400, detail="Invalid package")
     price = float(base) * float(multiplier)
-    order_code = generate_order_code()
-
-    order = OrderSchema(
-        product_id=str(product.get("_id")),
-        product_name=product.get("name"),
-        package=payload.package,
-        price=price,
-        buyer_name=payload.buyer_name,
-        email=payload.email,
-        whatsapp=payload.whatsapp,
-        payment_method=payload.payment_method,
-        status="pending",
-        order_code=order_code,
-        delivery_channel=payload.delivery_channel,
-    )
-    inserted_id = create_document("order", order)
+
+    now = datetime.now(timezone.utc)
+    order_doc = {
+        "product_id": str(product["_id"]),
+        "product_name": product.get("name"),
+        "package": payload.package,
+        "price": price,
+        "buyer_name": payload.buyer_name,
+        "email": payload.email,
+        "whatsapp": payload.whatsapp,
+        "payment_method": payload.payment_method,
+        "status": "pending",
+        "delivery_channel": payload.delivery_channel,
+        "created_at": now,
+        "updated_at": now,
+    }
+    # order_code is unique; regenerate on the rare collision instead of failing the order
+    for attempt in range(_ORDER_CODE_ATTEMPTS):
+        order_code = generate_order_code()
+        order_doc["order_code"] = order_code
+        order_doc.pop("_id", None)
+        try:
+            inserted_id = str((await orders.insert_one(order_doc)).inserted_id)
+            break
+        except DuplicateKeyError:
+            if attempt == _ORDER_CODE_ATTEMPTS - 1:
+                raise HTTPException(status_code=503, detail="Could not allocate order code, please retry")
 
     # Return mock payment instruction (for demo only)
-    payment_instructions = {
-        "QRIS": {
-            "type": "qris",
-            "note": "Scan QR berikut di aplikasi e-wallet Anda",
-            "qr_image": "https://api.qrserver.com/v1/create-qr-code/?size=220x220&data=NASIR-STORE-DEMO",
-        },
-        "Bank Transfer": {
-            "type": "bank",
-            "bank": "BCA",
-            "account_name": "NASIR STORE",
-            "account_number": "1234567890",
-        },
-        "E-Wallet": {
-            "type": "ewallet",
-            "provider": "OVO/DANA/GoPay",
-            "number": "0812-3456-7890",
-            "name": "NASIR STORE",
-        },
-    }.get(payload.payment_method, {"type": "info", "note": "Follow admin instruction"})
+    payment_instructions = _PAYMENT_INSTRUCTIONS[payload.payment_method]
 
     return {
         "order_id": inserted_id,
@@ -259,8 +545,8 @@ def create_order(payload: OrderCreate):
 
 
 @app.get("/api/orders/{order_code}")
-def get_order(order_code: str):
-    doc = db["order"].find_one({"order_code": order_code})
+async def get_order(order_code: str):
+    doc = await orders.find_one({"order_code": order_code})
     if not doc:
         raise HTTPException(status_code=404, detail="Order not found")
     return to_dict(doc)
@@ -272,12 +558,9 @@ class PaymentNotify(BaseModel):
 
 
 @app.post("/api/payments/notify")
-def payment_notify(payload: PaymentNotify):
-    order = db["order"].find_one({"order_code": payload.order_code})
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-
+async def payment_notify(payload: PaymentNotify):
     new_status = "paid" if payload.status == "paid" else "failed"
+    update = {"status": new_status, "updated_at": datetime.utcnow()}
     delivery_payload = None
 
     if new_status == "paid":
@@ -287,38 +570,43 @@ def payment_notify(payload: PaymentNotify):
             "password": "AutoGenerated123!",
             "note": "Gunakan kredensial ini sesuai ketentuan. Ini demo.",
         }
-        db["order"].update_one(
-            {"_id": order["_id"]},
-            {"$set": {"status": "delivered", "delivered_payload": delivery_payload, "updated_at": datetime.utcnow()}},
-        )
+        update["status"] = "delivered"
+        update["delivered_payload"] = delivery_payload
+
+    # Single round-trip: lookup and status change happen atomically
+    order = await orders.find_one_and_update(
+        {"order_code": payload.order_code},
+        {"$set": update},
+        projection={"_id": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    if delivery_payload is not None:
         return {"updated": True, "status": "delivered", "delivered_payload": delivery_payload}
-    else:
-        db["order"].update_one(
-            {"_id": order["_id"]},
-            {"$set": {"status": new_status, "updated_at": datetime.utcnow()}},
-        )
-        return {"updated": True, "status": new_status}
+    return {"updated": True, "status": new_status}
 
 
 # -------------------- Testimonials --------------------
 
 @app.get("/api/testimonials")
-def list_testimonials(limit: int = 50):
-    docs = db["testimonial"].find({}).sort("created_at", -1).limit(limit)
-    return [to_dict(d) for d in docs]
+async def list_testimonials(limit: int = 50):
+    docs = await _peek(testimonials.find({}).sort("created_at", -1).limit(limit)) or _empty()
+    return StreamingResponse(stream_json_array(docs), media_type="application/json")
 
 
 @app.post("/api/testimonials")
-def create_testimonial(body: TestimonialSchema):
-    inserted_id = create_document("testimonial", body)
+async def create_testimonial(body: TestimonialSchema):
+    inserted_id = await create_document("testimonial", body)
     return {"inserted_id": inserted_id}
 
 
 # -------------------- Contact --------------------
 
 @app.post("/api/contact")
-def create_contact(body: ContactSchema):
-    inserted_id = create_document("contactmessage", body)
+async def create_contact(body: ContactSchema):
+    inserted_id = await create_document("contactmessage", body)
     return {"inserted_id": inserted_id}
 
 
@@ -31,6 +31,7 @@ class Product(BaseModel):
     price_lifetime: Optional[float] = Field(None, ge=0, description="Lifetime price if available")
     is_featured: bool = Field(False)
     is_active: bool = Field(True)
+    name_lc: Optional[str] = Field(None, description="Lowercased name for index-backed prefix search")
 
 # Customer order
 class Order(BaseModel):
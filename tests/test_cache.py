@@ -0,0 +1,48 @@
+import asyncio
+
+import cache
+from cache import closest_query, query_sketch
+
+
+def test_query_sketch_normalises_case_and_whitespace():
+    assert query_sketch("  Net   Flix ") == query_sketch("net flix")
+
+
+def test_query_sketch_short_query_is_the_query_itself():
+    assert query_sketch("AI") == frozenset({"ai"})
+
+
+def test_closest_query_accepts_near_duplicates():
+    assert closest_query("netflix premium", ["spotify premium", "Netflix  Premium "]) == "Netflix  Premium "
+
+
+def test_closest_query_rejects_below_threshold():
+    # 5 of 13 trigrams shared, well under 0.8
+    assert closest_query("netflix", ["netflix premium"]) is None
+
+
+def test_closest_query_prefers_highest_similarity():
+    assert closest_query("youtube premium", ["youtube premiu", "youtube premium"]) == "youtube premium"
+
+
+class _DownRedis:
+    def __init__(self):
+        self.calls = 0
+
+    def pipeline(self, **kwargs):
+        self.calls += 1
+        raise ConnectionError("redis down")
+
+
+def test_failure_backs_off_instead_of_retrying(monkeypatch):
+    down = _DownRedis()
+    monkeypatch.setattr(cache, "_redis", down)
+    monkeypatch.setattr(cache, "_down_until", 0.0)
+
+    async def run():
+        assert await cache.get_cached_products("netflix", "", None, 100) is None
+        assert await cache.get_cached_products("netflix", "", None, 100) is None
+        await cache.set_cached_products("netflix", "", None, 100, b"[]")
+
+    asyncio.run(run())
+    assert down.calls == 1
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+import main
+from main import OrderCreate, generate_order_code
+
+
+def test_order_code_format(monkeypatch):
+    monkeypatch.setattr(main.time, "time", lambda: 1760549553.123)
+    monkeypatch.setattr(main.secrets, "token_hex", lambda n: "9f2c")
+    assert generate_order_code() == "NS-20251015173233123-9F2C"
+
+
+def test_order_code_suffix_separates_same_millisecond(monkeypatch):
+    suffixes = iter(["aaaa", "bbbb"])
+    monkeypatch.setattr(main.time, "time", lambda: 1760549553.123)
+    monkeypatch.setattr(main.secrets, "token_hex", lambda n: next(suffixes))
+    assert generate_order_code() != generate_order_code()
+
+
+class _Products:
+    async def find_one(self, filt, projection=None):
+        return {"_id": ObjectId(), "name": "Netflix Premium", "price_monthly": 35000}
+
+
+class _Orders:
+    """Rejects the first `collisions` inserts as duplicate order codes"""
+
+    def __init__(self, collisions):
+        self.collisions = collisions
+        self.codes = []
+
+    async def insert_one(self, doc):
+        self.codes.append(doc["order_code"])
+        if len(self.codes) <= self.collisions:
+            raise DuplicateKeyError("E11000 duplicate key error")
+        doc["_id"] = ObjectId()
+        return type("InsertOneResult", (), {"inserted_id": doc["_id"]})()
+
+
+def _payload():
+    return OrderCreate(
+        product_slug="netflix-premium",
+        package="1 Month",
+        buyer_name="Budi",
+        email="budi@example.com",
+        whatsapp="0812",
+        payment_method="QRIS",
+    )
+
+
+def test_create_order_regenerates_code_on_duplicate(monkeypatch):
+    orders = _Orders(collisions=1)
+    monkeypatch.setattr(main, "products", _Products())
+    monkeypatch.setattr(main, "orders", orders)
+
+    result = asyncio.run(main.create_order(_payload()))
+
+    assert len(orders.codes) == 2
+    assert orders.codes[0] != orders.codes[1]
+    assert result["order_code"] == orders.codes[1]
+
+
+def test_create_order_gives_up_after_repeated_duplicates(monkeypatch):
+    orders = _Orders(collisions=main._ORDER_CODE_ATTEMPTS)
+    monkeypatch.setattr(main, "products", _Products())
+    monkeypatch.setattr(main, "orders", orders)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.create_order(_payload()))
+
+    assert exc.value.status_code == 503
+    assert len(orders.codes) == main._ORDER_CODE_ATTEMPTS
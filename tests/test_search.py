@@ -0,0 +1,77 @@
+import asyncio
+
+import bson
+
+from main import ProductCreate, _confirm_substring, search_fields, text_trigrams, with_search_fields
+
+
+async def _cursor(docs):
+    for d in docs:
+        yield dict(d)
+
+
+def _collect(docs, q, limit):
+    async def run():
+        return [d async for d in _confirm_substring(_cursor(docs), q, limit)]
+    return asyncio.run(run())
+
+
+def test_text_trigrams_lowercases_and_joins_fields():
+    assert text_trigrams("Abcd", None, "ef") == sorted({"abc", "bcd", "cd ", "d e", " ef"})
+
+
+def test_text_trigrams_short_text_is_empty():
+    assert text_trigrams("ab") == []
+    assert text_trigrams(None, "") == []
+
+
+def test_query_trigrams_are_subset_of_document_trigrams():
+    doc = set(text_trigrams("Netflix Premium", "Akun Netflix 4K", "hemat"))
+    assert set(text_trigrams("flix prem")) <= doc
+
+
+def test_search_fields_match_text_trigrams():
+    assert search_fields("Canva Pro", "Desain", None) == {
+        "name_lc": "canva pro",
+        "trigrams": text_trigrams("Canva Pro", "Desain"),
+    }
+
+
+def test_confirm_substring_drops_trigram_false_positives():
+    docs = [
+        {"name": "Abc xyz", "description": "", "short_description": ""},
+        {"name": "Netflix", "description": "no match here", "short_description": ""},
+    ]
+    # "c x" spans a word boundary in the first doc only
+    assert [d["name"] for d in _collect(docs, "C X", 10)] == ["Abc xyz"]
+
+
+def test_confirm_substring_matches_description_and_strips_it():
+    docs = [{"name": "Canva Pro", "description": "Invite ke team", "short_description": "Desain"}]
+    result = _collect(docs, "ke tea", 10)
+    assert [d["name"] for d in result] == ["Canva Pro"]
+    assert "description" not in result[0]
+
+
+def test_confirm_substring_treats_query_literally():
+    docs = [{"name": "GPT-4/Plus", "description": "", "short_description": ""}, {"name": "GPTx4", "description": ""}]
+    assert [d["name"] for d in _collect(docs, "t-4", 10)] == ["GPT-4/Plus"]
+
+
+def test_confirm_substring_stops_at_limit():
+    docs = [{"name": f"Premium {i}", "description": ""} for i in range(5)]
+    assert len(_collect(docs, "premium", 2)) == 2
+
+
+def test_seeded_product_document_encodes_to_bson():
+    product = ProductCreate(
+        name="Netflix Premium",
+        slug="netflix-premium",
+        description="Akun Netflix Premium kualitas 4K.",
+        short_description="Netflix 4K, garansi, hemat.",
+        logo_url="https://upload.wikimedia.org/wikipedia/commons/0/08/Netflix_2015_logo.svg",
+        category="Streaming",
+        price_monthly=35000,
+    )
+    doc = with_search_fields(product)
+    assert bson.decode(bson.encode(doc))["logo_url"] == str(product.logo_url)
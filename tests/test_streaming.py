@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+
+import main
+
+
+class _FailingCursor:
+    def sort(self, *args, **kwargs):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        raise ServerSelectionTimeoutError("no servers")
+
+
+class _Collection:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def find(self, *args, **kwargs):
+        return self.cursor
+
+
+class _Cursor(_FailingCursor):
+    def __init__(self, docs):
+        self.docs = iter(docs)
+
+    async def __anext__(self):
+        try:
+            return next(self.docs)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+async def _body(response):
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+@pytest.fixture(autouse=True)
+def _clear_products_cache():
+    main._products_cache.clear()
+
+
+def test_list_products_raises_before_streaming_on_db_error(monkeypatch):
+    monkeypatch.setattr(main, "products", _Collection(_FailingCursor()))
+    with pytest.raises(ServerSelectionTimeoutError):
+        asyncio.run(main.list_products(q=None, category=None, featured=None, limit=10))
+
+
+def test_list_testimonials_raises_before_streaming_on_db_error(monkeypatch):
+    monkeypatch.setattr(main, "testimonials", _Collection(_FailingCursor()))
+    with pytest.raises(ServerSelectionTimeoutError):
+        asyncio.run(main.list_testimonials(limit=10))
+
+
+def test_list_testimonials_streams_json_array(monkeypatch):
+    monkeypatch.setattr(main, "testimonials", _Collection(_Cursor([{"_id": 1, "name": "a"}, {"_id": 2, "name": "b"}])))
+
+    async def run():
+        return await _body(await main.list_testimonials(limit=10))
+
+    assert asyncio.run(run()) == b'[{"_id":"1","name":"a"},{"_id":"2","name":"b"}]'
+
+
+def test_empty_listing_is_an_empty_array(monkeypatch):
+    monkeypatch.setattr(main, "testimonials", _Collection(_Cursor([])))
+
+    async def run():
+        return await _body(await main.list_testimonials(limit=10))
+
+    assert asyncio.run(run()) == b"[]"
+
+
+def _products_response(monkeypatch, stored):
+    docs = [{"_id": i, "name": f"p{i}"} for i in range(3)]
+    monkeypatch.setattr(main, "products", _Collection(_Cursor(docs)))
+
+    async def record(*args):
+        stored.append(args)
+
+    monkeypatch.setattr(main, "set_cached_products", record)
+    return main.list_products(q=None, category=None, featured=None, limit=10)
+
+
+def test_completed_product_stream_is_stored(monkeypatch):
+    stored = []
+
+    async def run():
+        response = await _products_response(monkeypatch, stored)
+        body = await _body(response)
+        await response.background()
+        return body
+
+    body = asyncio.run(run())
+    assert stored == [("", "", None, 10, body)]
+
+
+def test_disconnected_product_stream_is_not_stored(monkeypatch):
+    stored = []
+
+    async def run():
+        response = await _products_response(monkeypatch, stored)
+        stream = response.body_iterator
+        await stream.__anext__()
+        await stream.__anext__()
+        # Client went away mid-body: the stream is closed, the background task still runs
+        await stream.aclose()
+        await response.background()
+
+    asyncio.run(run())
+    assert stored == []
+    assert main._products_cache.get(("", "", None, 10)) is None